@@ -8,6 +8,8 @@ class _LuaApiFunc:
     transpiler can inspect its attributes.
     """
 
+    __slots__ = ("lua_table", "lua_name")
+
     def __init__(self, lua_table: str, lua_name: str):
         self.lua_table = lua_table        # e.g. "peripheral"
         self.lua_name = lua_name          # e.g. "getNames"
@@ -35,8 +37,24 @@ class Peripheral:
     get_methods = _LuaApiFunc(lua_table="peripheral", lua_name="getMethods")
 
 
-
 peripheral = Peripheral()
 # Transpiler hint: for any attribute on `peripheral` that is an instance
 # of _LuaApiFunc, translate `peripheral.attr_name(...)` to
 # `peripheral.<lua_name>(...)` in the generated Lua.
+
+# Objects a script can import from cc_lib, by exported name. Add new API
+# objects here so the transpiler picks up their _LuaApiFunc names.
+_EXPORTS = {
+    "peripheral": peripheral,
+}
+
+# (exported_name, python_attr) -> lua_name for every API function on the
+# exported objects, so the transpiler can look names up instead of
+# re-deriving them. Keyed by the name a script imports
+# (`from cc_lib import peripheral`).
+CC_LIB_ATTR_MAP = {
+    (export, attr): func.lua_name
+    for export, obj in _EXPORTS.items()
+    for attr, func in vars(type(obj)).items()
+    if isinstance(func, _LuaApiFunc)
+}
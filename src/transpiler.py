@@ -1,11 +1,78 @@
 import ast
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from os import getenv
 from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import cc_lib
+from cc_lib import CC_LIB_ATTR_MAP
 
 SRC_FILE = Path(getenv('in_file', "transpiler_in.py"))
 OUT_FILE = Path(getenv('out_file', "transpiler_out.lua"))
+# Generated Lua is cached here, keyed by a hash of the source file and of
+# this transpiler and cc_lib (so edits to either invalidate old entries)
+_cache_dir = getenv('cache_dir')
+CACHE_DIR = (
+    Path(_cache_dir) if _cache_dir is not None
+    else Path.home() / ".cache" / "1710_pack_lua"
+)
+_TRANSPILER_HASH = hashlib.sha256(
+    Path(__file__).read_bytes() + Path(cc_lib.__file__).read_bytes()
+).digest()
+
+# Python operator node type -> Lua operator
+_BINOPS: dict[type, str] = {
+    ast.Add: "+",
+    ast.Sub: "-",
+    ast.Mult: "*",
+    ast.Div: "/",
+}
+_CMPOPS: dict[type, str] = {
+    ast.Eq: "==",
+    ast.NotEq: "~=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+}
+
+# Python constant type -> Lua literal. Keyed on exact type so that
+# bool is not treated as int.
+_CONSTANTS: dict[type, Callable[[Any], str]] = {
+    str: lambda v: f"\"{v}\"",
+    bool: lambda v: "true" if v else "false",
+    int: str,
+    float: repr,
+    type(None): lambda v: "nil",
+}
+
+# Block header templates
+_IF_HEAD = "if %s then"
+_WHILE_HEAD = "while %s do"
+_FUNC_HEAD = "function %s(%s)"
+
+
+class _UnsupportedExpression:
+    """
+    Message for expressions the transpiler has no handler for.
+    The node is only dumped when the exception is actually rendered.
+    """
+
+    __slots__ = ("node",)
 
+    def __init__(self, node: ast.AST):
+        self.node = node
 
+    def __str__(self) -> str:
+        return f"Unsupported expression: {ast.dump(self.node)}"
+
+
+@lru_cache(maxsize=512)
 def snake_to_camel(name: str) -> str:
     """
     Convert snake_case -> camelCase (first segment stays lowercase).
@@ -17,23 +84,83 @@ def snake_to_camel(name: str) -> str:
     return parts[0] + "".join(p.capitalize() for p in parts[1:])
 
 
-class PyToLua(ast.NodeVisitor):
-    def __init__(self):
-        self.lines = []
-        self.indent = 0
+class PyToLua:
+    def __init__(self) -> None:
+        self.buf: io.StringIO = io.StringIO()
+        # Separator written before the next line; empty until the first
+        # emit so the output carries no trailing newline.
+        self._sep: str = ""
+        self.indent: int = 0
+        # Indent prefixes by level, grown lazily by `emit`
+        self._indents: list[str] = [""]
+        # Local symbol name -> module and -> original name, e.g.
+        # {"peripheral": "cc_lib"} and {"peripheral": "peripheral"}
+        self._import_module: dict[str, str] = {}
+        self._import_origname: dict[str, str | None] = {}
+        # Track if we saw a `main` function so we can call it at end
+        self.has_main: bool = False
+        # Statement node type -> handler, see `visit`
+        self._stmt_handlers: dict[type, Callable[[Any], None]] = {
+            ast.Module: self.visit_Module,
+            ast.ImportFrom: self.visit_ImportFrom,
+            ast.Import: self.visit_Import,
+            ast.Expr: self.visit_Expr,
+            ast.Assign: self.visit_Assign,
+            ast.If: self.visit_If,
+            ast.While: self.visit_While,
+            ast.FunctionDef: self.visit_FunctionDef,
+        }
+        # Expression node type -> handler, see `expr`
+        self._expr_handlers: dict[type, Callable[[Any], str]] = {
+            ast.Constant: self._expr_constant,
+            ast.Name: self._expr_name,
+            ast.Attribute: self._expr_attribute,
+            ast.BinOp: self._expr_binop,
+            ast.UnaryOp: self._expr_unaryop,
+            ast.Compare: self._expr_compare,
+            ast.Call: self._expr_call,
+        }
+
+    @property
+    def imports(self) -> dict[str, tuple[str, str | None]]:
         # Map of local symbol name -> (module, original_name)
         # e.g. {"peripheral": ("cc_lib", "peripheral")}
-        self.imports: dict[str, tuple[str, str]] = {}
-        # Track if we saw a `main` function so we can call it at end
-        self.has_main = False
+        origname = self._import_origname
+        return {
+            local: (module, origname[local])
+            for local, module in self._import_module.items()
+        }
 
     def emit(self, text: str) -> None:
-        self.lines.append("    " * self.indent + text)
+        indents = self._indents
+        while self.indent >= len(indents):
+            indents.append(indents[-1] + "    ")
+        w = self.buf.write
+        w(self._sep)
+        w(indents[self.indent])
+        w(text)
+        self._sep = "\n"
+
+    def visit(self, node: ast.AST) -> None:
+        handler = self._stmt_handlers.get(type(node))
+        if handler is None:
+            self.generic_visit(node)
+        else:
+            handler(node)
+
+    def visit_body(self, stmts: list[ast.stmt]) -> None:
+        visit = self.visit
+        for stmt in stmts:
+            visit(stmt)
+
+    def generic_visit(self, node: ast.AST) -> None:
+        # Same fallback as ast.NodeVisitor: walk into unsupported nodes
+        for child in ast.iter_child_nodes(node):
+            self.visit(child)
 
     # --- top level ---
     def visit_Module(self, node: ast.Module) -> None:
-        for stmt in node.body:
-            self.visit(stmt)
+        self.visit_body(node.body)
         # Auto-call main if defined
         if self.has_main:
             self.emit("main()")
@@ -46,13 +173,15 @@ class PyToLua(ast.NodeVisitor):
             return
         for alias in node.names:
             local = alias.asname or alias.name
-            self.imports[local] = (module, alias.name)
+            self._import_module[local] = module
+            self._import_origname[local] = alias.name
 
     def visit_Import(self, node: ast.Import) -> None:
         # import cc_lib as lib  (less useful for direct API but we record anyway)
         for alias in node.names:
             local = alias.asname or alias.name
-            self.imports[local] = (alias.name, None)
+            self._import_module[local] = alias.name
+            self._import_origname[local] = None
 
     # --- statements ---
     def visit_Expr(self, node: ast.Expr) -> None:
@@ -67,25 +196,22 @@ class PyToLua(ast.NodeVisitor):
 
     def visit_If(self, node: ast.If) -> None:
         cond = self.expr(node.test)
-        self.emit(f"if {cond} then")
+        self.emit(_IF_HEAD % cond)
         self.indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        self.visit_body(node.body)
         self.indent -= 1
         if node.orelse:
             self.emit("else")
             self.indent += 1
-            for stmt in node.orelse:
-                self.visit(stmt)
+            self.visit_body(node.orelse)
             self.indent -= 1
         self.emit("end")
 
     def visit_While(self, node: ast.While) -> None:
         cond = self.expr(node.test)
-        self.emit(f"while {cond} do")
+        self.emit(_WHILE_HEAD % cond)
         self.indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        self.visit_body(node.body)
         self.indent -= 1
         self.emit("end")
 
@@ -93,10 +219,9 @@ class PyToLua(ast.NodeVisitor):
         # Very small subset: only simple positional args
         args = [arg.arg for arg in node.args.args]
         args_src = ", ".join(args)
-        self.emit(f"function {node.name}({args_src})")
+        self.emit(_FUNC_HEAD % (node.name, args_src))
         self.indent += 1
-        for stmt in node.body:
-            self.visit(stmt)
+        self.visit_body(node.body)
         self.indent -= 1
         self.emit("end")
         if node.name == "main":
@@ -104,92 +229,145 @@ class PyToLua(ast.NodeVisitor):
 
     # --- expressions ---
     def expr(self, node: ast.AST) -> str:
-        if isinstance(node, ast.Constant):
-            if isinstance(node.value, str):
-                return f"\"{node.value}\""
-            return repr(node.value)
-
-        if isinstance(node, ast.Name):
-            return node.id
-
-        if isinstance(node, ast.Attribute):
-            # Handle object.attribute – we care especially about
-            # imported cc_lib objects like `peripheral.get_names`
-            value_src = self.expr(node.value)
-            attr = node.attr
+        handler = self._expr_handlers.get(type(node))
+        if handler is None:
+            raise NotImplementedError(_UnsupportedExpression(node))
+        return handler(node)
+
+    def _expr_constant(self, node: ast.Constant) -> str:
+        value = node.value
+        return _CONSTANTS.get(type(value), repr)(value)
+
+    def _expr_name(self, node: ast.Name) -> str:
+        return node.id
+
+    def _expr_attribute(self, node: ast.Attribute) -> str:
+        # Handle object.attribute – we care especially about
+        # imported cc_lib objects like `peripheral.get_names`
+        value = node.value
+        if isinstance(value, ast.Name):
+            # Fast path for the common `name.attr` shape: no recursion.
             # If base is an imported symbol from cc_lib, convert attr to camelCase.
             # Example Python:   peripheral.get_names
             # Becomes Lua:      peripheral.getNames
-            if (
-                isinstance(node.value, ast.Name)
-                and node.value.id in self.imports
-                and self.imports[node.value.id][0] == "cc_lib"
-            ):
-                lua_attr = snake_to_camel(attr)
-                return f"{value_src}.{lua_attr}"
-            # Fallback: keep attribute as-is
-            return f"{value_src}.{attr}"
-
-        if isinstance(node, ast.BinOp):
-            left = self.expr(node.left)
-            right = self.expr(node.right)
-            op = self.binop(node.op)
-            return f"({left} {op} {right})"
-
-        if isinstance(node, ast.UnaryOp):
-            operand = self.expr(node.operand)
-            if isinstance(node.op, ast.USub):
-                return f"(-{operand})"
-            raise NotImplementedError("Only unary minus supported")
-
-        if isinstance(node, ast.Compare):
-            if len(node.ops) != 1 or len(node.comparators) != 1:
-                raise NotImplementedError("Only simple comparisons supported")
-            left = self.expr(node.left)
-            right = self.expr(node.comparators[0])
-            op = self.cmpop(node.ops[0])
-            return f"({left} {op} {right})"
-
-        if isinstance(node, ast.Call):
-            func = self.expr(node.func)
-            args = ", ".join(self.expr(a) for a in node.args)
-            return f"{func}({args})"
-
-        raise NotImplementedError(f"Unsupported expression: {ast.dump(node)}")
+            name = value.id
+            if self._import_module.get(name) == "cc_lib":
+                attr = node.attr
+                origname = self._import_origname[name]
+                lua_attr = None
+                if origname is not None:
+                    lua_attr = CC_LIB_ATTR_MAP.get((origname, attr))
+                if lua_attr is None:
+                    lua_attr = snake_to_camel(attr)
+                return f"{name}.{lua_attr}"
+            return f"{name}.{node.attr}"
+        # Fallback: keep attribute as-is
+        return f"{self.expr(value)}.{node.attr}"
+
+    def _expr_binop(self, node: ast.BinOp) -> str:
+        left = self.expr(node.left)
+        right = self.expr(node.right)
+        op = self.binop(node.op)
+        return f"({left} {op} {right})"
+
+    def _expr_unaryop(self, node: ast.UnaryOp) -> str:
+        operand = self.expr(node.operand)
+        if isinstance(node.op, ast.USub):
+            return f"(-{operand})"
+        raise NotImplementedError("Only unary minus supported")
+
+    def _expr_compare(self, node: ast.Compare) -> str:
+        if len(node.ops) != 1 or len(node.comparators) != 1:
+            raise NotImplementedError("Only simple comparisons supported")
+        left = self.expr(node.left)
+        right = self.expr(node.comparators[0])
+        op = self.cmpop(node.ops[0])
+        return f"({left} {op} {right})"
+
+    def _expr_call(self, node: ast.Call) -> str:
+        func = self.expr(node.func)
+        args = ", ".join([self.expr(a) for a in node.args])
+        return f"{func}({args})"
 
     def binop(self, op: ast.AST) -> str:
-        if isinstance(op, ast.Add):
-            return "+"
-        if isinstance(op, ast.Sub):
-            return "-"
-        if isinstance(op, ast.Mult):
-            return "*"
-        if isinstance(op, ast.Div):
-            return "/"
-        raise NotImplementedError(f"Unsupported binop: {op}")
+        try:
+            return _BINOPS[type(op)]
+        except KeyError:
+            raise NotImplementedError(f"Unsupported binop: {op}") from None
 
     def cmpop(self, op: ast.AST) -> str:
-        if isinstance(op, ast.Eq):
-            return "=="
-        if isinstance(op, ast.NotEq):
-            return "~="
-        if isinstance(op, ast.Lt):
-            return "<"
-        if isinstance(op, ast.LtE):
-            return "<="
-        if isinstance(op, ast.Gt):
-            return ">"
-        if isinstance(op, ast.GtE):
-            return ">="
-        raise NotImplementedError(f"Unsupported cmpop: {op}")
+        try:
+            return _CMPOPS[type(op)]
+        except KeyError:
+            raise NotImplementedError(f"Unsupported cmpop: {op}") from None
+
+
+# path -> (source digest, parsed module), so repeated builds of an
+# unchanged file skip ast.parse. Keyed on content rather than mtime so a
+# same-size edit within one mtime tick is never served a stale tree. One
+# entry per path: a changed file replaces its previous tree.
+_AST_CACHE: dict[str, tuple[bytes, ast.Module]] = {}
+
+
+def parse_file(src: Path) -> ast.Module:
+    path = str(src)
+    data = src.read_bytes()
+    digest = hashlib.sha256(data).digest()
+    cached = _AST_CACHE.get(path)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    tree = ast.parse(data.decode("utf8"), filename=path)
+    _AST_CACHE[path] = (digest, tree)
+    return tree
+
+
+def _write_cache(cache_path: Path, output: bytes) -> None:
+    # Best effort: an unwritable cache must not fail the transpile. The
+    # entry is written to a temp file and moved into place so concurrent
+    # workers never read a partial file.
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(output)
+            os.replace(tmp, cache_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
 
 
 def transpile_file(src: Path, dst: Path) -> None:
-    code = src.read_text(encoding="utf8")
-    tree = ast.parse(code, filename=str(src))
-    compiler = PyToLua()
-    compiler.visit(tree)
-    dst.write_text("\n".join(compiler.lines), encoding="utf8")
+    # Hash and parse the same bytes, so a cache entry always matches the
+    # source it was built from
+    data = src.read_bytes()
+    digest = hashlib.sha256(_TRANSPILER_HASH + data).hexdigest()
+    cache_path = CACHE_DIR / f"{digest}.lua"
+    try:
+        # Bytes, not text: a hit must return exactly what the miss produced
+        output = cache_path.read_bytes().decode("utf8")
+    except OSError:
+        tree = ast.parse(data.decode("utf8"), filename=str(src))
+        compiler = PyToLua()
+        compiler.visit(tree)
+        output = compiler.buf.getvalue()
+        _write_cache(cache_path, output.encode("utf8"))
+    dst.write_text(output, encoding="utf8")
+
+
+def _transpile_pair(pair: tuple[str | Path, str | Path]) -> None:
+    src, dst = pair
+    transpile_file(Path(src), Path(dst))
+
+
+def transpile_files(pairs: Iterable[tuple[str | Path, str | Path]]) -> None:
+    """
+    Transpile many (src, dst) pairs, one worker process per core.
+    """
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(_transpile_pair, pairs))
 
 
 if __name__ == "__main__":